@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import zlib
+import threading
+
+# 签名长度（分桶数）与 LSH 分段参数：32 段 × 4 行，相似度约 0.5 以上的文档对大概率进入候选
+NUM_PERM = 128
+BANDS = 32
+SHINGLE_SIZE = 5
+SIMILARITY_THRESHOLD = 0.6
+INDEX_VERSION = 1
+
+_HASH_MAX = 0xFFFFFFFF
+_EMPTY = _HASH_MAX + 1
+
+def normalize_text(text):
+    """去掉空白和标点，只保留汉字、字母和数字，避免排版差异影响比对"""
+    return ''.join(re.findall(r'[0-9A-Za-z一-龥]', text))
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """
+    将正文切分为连续汉字片段（shingle）并计算32位哈希
+    使用 crc32 保证哈希值在不同进程、不同批次之间稳定
+    """
+    text = normalize_text(text)
+    if not text:
+        return set()
+    if len(text) <= size:
+        grams = [text]
+    else:
+        grams = [text[i:i + size] for i in range(len(text) - size + 1)]
+    hashes = set()
+    for gram in grams:
+        h = zlib.crc32(gram.encode('utf-8'))
+        # 混合高低位，让 crc32 的结果在各个分桶中分布更均匀
+        h = (h * 0x9E3779B1) & _HASH_MAX
+        h ^= h >> 16
+        hashes.add(h)
+    return hashes
+
+def minhash_signature(hashes, num_perm=NUM_PERM):
+    """
+    计算 MinHash 签名（单次置换分桶 + 循环填充）
+    每个片段只需哈希一次，签名计算为 O(片段数)，适合几千篇文章的批量处理
+    """
+    if not hashes:
+        return []
+    bin_size = (_HASH_MAX + 1) // num_perm
+    signature = [_EMPTY] * num_perm
+    for h in hashes:
+        index = h // bin_size
+        value = h % bin_size
+        if value < signature[index]:
+            signature[index] = value
+    # 空桶取后面第一个非空桶的值，保证签名每一位都可比较
+    for i in range(num_perm):
+        if signature[i] == _EMPTY:
+            for step in range(1, num_perm):
+                value = signature[(i + step) % num_perm]
+                if value != _EMPTY:
+                    signature[i] = value + step * bin_size
+                    break
+    return signature
+
+def estimate_similarity(sig_a, sig_b):
+    """根据两个签名估算 Jaccard 相似度"""
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    same = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return same / len(sig_a)
+
+class DuplicateIndex:
+    """
+    跨批次持久化的近似重复检测索引
+    签名保存在 JSON 文件中，分段桶在加载时重建
+    """
+
+    def __init__(self, path=None, num_perm=NUM_PERM, bands=BANDS):
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.entries = {}  # 键 -> {"signature": [...], "batch": ...}
+        self.buckets = {}  # (段号, 段哈希) -> 键集合
+        self.batch_keys = set()  # 本批次新加入的文档
+        self.failed = []  # 本批次未能加入索引的文档：(键, 原因)
+        self.batch = None  # 本批次名称，写入索引便于追溯文章来自哪一批
+        self.source = None  # 本批次的输入目录，加在键前面，不同批次中相对路径相同的文档不会互相覆盖
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """从文件加载索引，文件不存在或版本不匹配时返回空索引"""
+        index = cls(path)
+        if not path or not os.path.exists(path):
+            return index
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if (data.get('version') != INDEX_VERSION
+                    or data.get('num_perm') != index.num_perm
+                    or data.get('bands') != index.bands):
+                print(f"! 查重索引版本不匹配，已重新建立：{path}")
+                return index
+            for key, entry in data.get('entries', {}).items():
+                index._insert(key, entry['signature'], entry.get('batch'))
+        except Exception as e:
+            print(f"! 读取查重索引时出错，已重新建立：{str(e)}")
+            index.entries.clear()
+            index.buckets.clear()
+        return index
+
+    def save(self, path=None):
+        """保存索引到文件"""
+        path = path or self.path
+        if not path:
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'entries': self.entries,
+        }
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, hash(tuple(signature[start:start + self.rows]))
+
+    def _insert(self, key, signature, batch=None):
+        self.entries[key] = {'signature': signature, 'batch': batch}
+        for band_key in self._band_keys(signature):
+            self.buckets.setdefault(band_key, set()).add(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        for band_key in self._band_keys(entry['signature']):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def source_key(self, key):
+        """返回 key 在索引中实际使用的键：设置了 source 时为 “输入目录/key”"""
+        if self.source:
+            return f"{self.source}/{key}"
+        return key
+
+    def add(self, key, text, batch=None):
+        """
+        加入一篇文章的正文
+        只有同一输入目录（source）中的同名文档才会覆盖之前的记录，重新处理同一批文件时不会与自己重复
+        返回是否成功生成签名（正文为空时不加入索引）
+        """
+        signature = minhash_signature(shingle_hashes(text), self.num_perm)
+        if not signature:
+            return False
+        key = self.source_key(key)
+        with self._lock:
+            self._remove(key)
+            self._insert(key, signature, batch or self.batch)
+            self.batch_keys.add(key)
+        return True
+
+    def candidates(self, key):
+        """返回与指定文档至少有一个分段落入同一桶的文档"""
+        entry = self.entries.get(key)
+        if not entry:
+            return set()
+        result = set()
+        for band_key in self._band_keys(entry['signature']):
+            result.update(self.buckets.get(band_key, ()))
+        result.discard(key)
+        return result
+
+    def find_duplicates(self, keys=None, threshold=SIMILARITY_THRESHOLD):
+        """
+        查找疑似重复的文档对
+        keys 为空时只检查本批次新加入的文档（与历史批次及本批次互相比较）
+        返回按相似度从高到低排序的 (键1, 键2, 相似度) 列表
+        """
+        if keys is None:
+            keys = self.batch_keys
+        pairs = {}
+        for key in keys:
+            entry = self.entries.get(key)
+            if not entry:
+                continue
+            for other in self.candidates(key):
+                pair = tuple(sorted((key, other)))
+                if pair in pairs:
+                    continue
+                similarity = estimate_similarity(entry['signature'], self.entries[other]['signature'])
+                if similarity >= threshold:
+                    pairs[pair] = similarity
+        return sorted(((a, b, s) for (a, b), s in pairs.items()), key=lambda x: (-x[2], x[0], x[1]))
+
+def write_duplicate_report(pairs, index, report_path):
+    """将疑似重复的文档对写入报告文件"""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(f"疑似重复文章报告（相似度阈值 {SIMILARITY_THRESHOLD:.0%}）\n")
+        f.write("=" * 50 + "\n\n")
+        if not pairs:
+            f.write("未发现疑似重复的文章\n")
+            return
+        for a, b, similarity in pairs:
+            batch_a = index.entries[a].get('batch') or ''
+            batch_b = index.entries[b].get('batch') or ''
+            f.write(f"相似度 {similarity:.0%}\n  {a}  {batch_a}\n  {b}  {batch_b}\n\n")
@@ -12,7 +12,13 @@ import io
 import os
 import shutil
 import re
+import time
 from docx import Document
+from duplicate_check import DuplicateIndex, write_duplicate_report
+from slow_file_profiler import SlowFileProfiler
+from input_scanner import scan_inputs
+from scheduler import BatchScheduler, TimingHistory, DEFAULT_WORKERS, HISTORY_FILENAME
+from template_cache import warm_template_cache
 
 class RedirectText:
     def __init__(self, text_widget, error_only=False):
@@ -20,38 +26,63 @@ class RedirectText:
         self.error_only = error_only
         self.error_files = set()  # 存储错误文件路径
         self.success_files = set()  # 存储成功文件路径
-        self.current_file = None  # 当前正在处理的文件
+        self._local = threading.local()  # 每个工作线程各自记录当前正在处理的文件
+        self._buffers = {}  # 文件 -> 暂存的信息，按作者顺序输出前不直接显示
+        self._lock = threading.Lock()
 
-    def set_current_file(self, filename):
-        self.current_file = filename
+    @property
+    def current_file(self):
+        return getattr(self._local, 'current_file', None)
+
+    def set_current_file(self, filename, buffered=False):
+        """设置当前线程正在处理的文件；buffered 为 True 时该文件的信息暂存，待 flush_file 时显示"""
+        self._local.current_file = filename
+        if buffered and filename:
+            with self._lock:
+                self._buffers.setdefault(filename, [])
+
+    def flush_file(self, filename):
+        """显示文件暂存的信息"""
+        with self._lock:
+            messages = self._buffers.pop(filename, [])
+        for message in messages:
+            self.text_widget.insert('end', message)
+        if messages:
+            self.text_widget.see('end')
+            self.text_widget.update()
 
     def write(self, string):
         if not string.strip():
             return
         # 检查是否是错误信息
+        current_file = self.current_file
         if string.strip().startswith('×') or string.strip().startswith('!'):
             # 如果有当前文件，添加到错误文件集合中
-            if self.current_file:
-                self.error_files.add(self.current_file)
+            if current_file:
+                self.error_files.add(current_file)
         # 检查是否是成功信息
         elif string.strip().startswith('✓'):
             # 如果有当前文件，添加到成功文件集合中
-            if self.current_file:
-                self.success_files.add(self.current_file)
+            if current_file:
+                self.success_files.add(current_file)
             
         # 显示错误信息，每个文件占一行
         if string.strip().startswith('×') or string.strip().startswith('!'):
-            if self.current_file:
+            if current_file:
                 if not string.strip().endswith('.docx'):
-                    # 提取作者行数字和作者名
-                    author_num = extract_author_number(self.current_file)
-                    author_name = extract_author_from_filename(self.current_file)
+                    # 提取作者行数字和作者名（当前文件可能是子文件夹或压缩包中的虚拟路径）
+                    author_num = extract_author_number(os.path.basename(current_file))
+                    author_name = extract_author_from_filename(os.path.basename(current_file))
                     error_msg = f"作者{author_num}({author_name}): {string.strip()}\n"
                 else:
                     error_msg = string
             else:
                 error_msg = string
             
+            with self._lock:
+                if current_file in self._buffers:
+                    self._buffers[current_file].append(error_msg)
+                    return
             self.text_widget.insert('end', error_msg)
             self.text_widget.see('end')
             self.text_widget.update()
@@ -65,7 +96,8 @@ class RedirectText:
     def clear_files(self):
         self.error_files.clear()
         self.success_files.clear()
-        self.current_file = None
+        self._buffers.clear()
+        self._local.current_file = None
 
 class App:
     def __init__(self, root):
@@ -102,6 +134,14 @@ class App:
         self.pack_error_btn.pack(side=tk.LEFT, padx=5)
         self.pack_error_btn.state(['disabled'])
         
+        # 暂停/继续和取消按钮（仅在转换过程中可用）
+        self.pause_btn = ttk.Button(button_frame, text="暂停", command=self.toggle_pause)
+        self.pause_btn.pack(side=tk.LEFT, padx=5)
+        self.pause_btn.state(['disabled'])
+        self.cancel_btn = ttk.Button(button_frame, text="取消", command=self.cancel_conversion)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_btn.state(['disabled'])
+        
         # 添加提取图片按钮
         self.extract_images_btn = ttk.Button(button_frame, text="提取图片", command=self.extract_images)
         self.extract_images_btn.pack(side=tk.LEFT, padx=5)
@@ -110,6 +150,18 @@ class App:
         self.extract_titles_btn = ttk.Button(button_frame, text="提取标题", command=self.extract_titles)
         self.extract_titles_btn.pack(side=tk.LEFT, padx=5)
         
+        # 慢文件性能分析开关
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="慢文件性能分析", variable=self.profile_var).pack(side=tk.LEFT, padx=5)
+        # 抽样间隔（每 N 个文件分析一个）和耗时阈值（秒，填写后只按阈值保留，留空时按百分位保留）
+        ttk.Label(button_frame, text="每").pack(side=tk.LEFT)
+        self.sample_every_var = tk.StringVar(value="1")
+        ttk.Spinbox(button_frame, from_=1, to=100, width=4,
+                    textvariable=self.sample_every_var).pack(side=tk.LEFT)
+        ttk.Label(button_frame, text="个文件分析一个，阈值(秒):").pack(side=tk.LEFT)
+        self.threshold_var = tk.StringVar(value="")
+        ttk.Entry(button_frame, textvariable=self.threshold_var, width=5).pack(side=tk.LEFT, padx=(0, 5))
+        
         # 进度显示
         self.progress_var = tk.StringVar(value="就绪")
         ttk.Label(main_frame, textvariable=self.progress_var).grid(row=3, column=0, columnspan=3)
@@ -128,6 +180,10 @@ class App:
         self.redirect = RedirectText(self.log_text, error_only=True)
         sys.stdout = self.redirect
         sys.stderr = self.redirect
+        
+        # 最近一次转换的输入文件，按虚拟路径索引，用于打包错误文件
+        self.work_items = {}
+        self.scheduler = None  # 正在进行的转换的调度器
 
     def choose_input_dir(self):
         directory = filedialog.askdirectory()
@@ -162,10 +218,12 @@ class App:
             copied_count = 0
             for filename in error_files:
                 try:
-                    src_path = os.path.join(self.input_path.get(), filename)
-                    if os.path.exists(src_path):
-                        dst_path = os.path.join(error_dir, filename)
-                        shutil.copy2(src_path, dst_path)
+                    item = self.work_items.get(filename)
+                    if item is not None:
+                        # 保留子文件夹和压缩包的层级，避免不同文件夹中的同名文件互相覆盖
+                        dst_path = os.path.join(error_dir, *filename.split('/'))
+                        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                        item.copy_to(dst_path)
                         copied_count += 1
                 except Exception as e:
                     print(f"× 复制文件 {filename} 时出错：{str(e)}")
@@ -179,6 +237,26 @@ class App:
         except Exception as e:
             self.progress_var.set(f"打包错误文件时出错: {str(e)}")
 
+    def toggle_pause(self):
+        scheduler = self.scheduler
+        if scheduler is None:
+            return
+        if scheduler.paused:
+            scheduler.resume()
+            self.pause_btn.config(text="暂停")
+            self.progress_var.set("继续处理...")
+        else:
+            scheduler.pause()
+            self.pause_btn.config(text="继续")
+            self.progress_var.set("已暂停，正在处理的文件完成后停止")
+
+    def cancel_conversion(self):
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+            self.cancel_btn.state(['disabled'])
+            self.pause_btn.state(['disabled'])
+            self.progress_var.set("正在取消，等待正在处理的文件完成...")
+
     def start_conversion(self):
         input_dir = self.input_path.get()
         output_dir = self.output_path.get()
@@ -192,11 +270,24 @@ class App:
             self.progress_var.set("输入目录不存在")
             return
         
-        # 检查是否有 Word 文件
-        input_files = [f for f in os.listdir(input_dir) if f.endswith('.docx')]
-        if not input_files:
+        # 检查是否有 Word 文件（包括子文件夹和 .zip 压缩包中的文件）
+        work_items = scan_inputs(input_dir, exclude_dirs=[output_dir])
+        if not work_items:
             self.progress_var.set("输入目录中没有 Word 文件")
             return
+        self.work_items = {item.virtual_path: item for item in work_items}
+        
+        # 读取性能分析设置
+        profile_enabled = self.profile_var.get()
+        try:
+            sample_every = int(self.sample_every_var.get())
+            threshold_text = self.threshold_var.get().strip()
+            threshold_seconds = float(threshold_text) if threshold_text else None
+            if sample_every < 1 or (threshold_seconds is not None and threshold_seconds < 0):
+                raise ValueError
+        except ValueError:
+            self.progress_var.set("性能分析设置无效：抽样间隔须为正整数，阈值须为非负数或留空")
+            return
         
         # 清空之前的文件记录
         self.redirect.clear_files()
@@ -207,38 +298,120 @@ class App:
         self.progress_var.set("处理中...")
         self.log_text.delete(1.0, tk.END)
         
+        # 按作者数字排序：调度器按成本决定处理顺序，但日志和报告仍按这个顺序输出
+        sorted_items = sorted(work_items, key=lambda item: extract_author_number(item.name))
+        
+        # 按估算成本从大到小调度；性能分析同一时间只能有一个 cProfile 在运行，此时只用一个线程
+        history_path = os.path.join(output_dir, HISTORY_FILENAME)
+        self.scheduler = BatchScheduler(sorted_items, workers=1 if profile_enabled else DEFAULT_WORKERS,
+                                        history=TimingHistory.load(history_path),
+                                        initializer=warm_template_cache)
+        scheduler = self.scheduler
+        self.pause_btn.config(text="暂停")
+        self.pause_btn.state(['!disabled'])
+        self.cancel_btn.state(['!disabled'])
+        
         # 在新线程中运行转换
         def conversion_thread():
             try:
-                # 获取目录中的所有文件并排序
-                input_files = [f for f in os.listdir(input_dir) if f.endswith('.docx')]
-                sorted_files = sorted(input_files, key=lambda x: extract_author_number(x))
-                
-                total_files = len(sorted_files)
+                total_files = len(sorted_items)
                 self.progress_var.set(f"开始处理，共 {total_files} 个文件...")
                 
-                # 处理每个文件
-                for index, filename in enumerate(sorted_files, 1):
-                    self.progress_var.set(f"正在处理第 {index}/{total_files} 个文件...")
-                    input_file = os.path.join(input_dir, filename)
-                    
-                    # 设置当前处理的文件
-                    self.redirect.set_current_file(filename)
-                    
-                    # 处理单个文件
-                    process_word_file(input_file, output_dir)
+                # 加载跨批次的查重索引
+                index_path = os.path.join(output_dir, "查重索引.json")
+                duplicate_index = DuplicateIndex.load(index_path)
+                duplicate_index.batch = f"{time.strftime('%Y-%m-%d %H:%M')} {os.path.basename(input_dir)}"
+                duplicate_index.source = os.path.abspath(input_dir).replace('\\', '/')
+                
+                # 可选：记录每个文件的耗时，保留慢文件的性能数据
+                profiler = SlowFileProfiler(output_dir, sample_every=sample_every,
+                                            threshold_seconds=threshold_seconds) if profile_enabled else None
+                
+                # 处理单个文件（在工作线程中执行）
+                def process_item(item):
+                    # 设置当前处理的文件，信息暂存到按作者顺序输出时再显示
+                    self.redirect.set_current_file(item.virtual_path, buffered=True)
+                    try:
+                        with item.open() as source:
+                            if profiler:
+                                return profiler.run(item.virtual_path, item.size,
+                                                    process_word_file, source, output_dir,
+                                                    duplicate_index=duplicate_index, source_name=item.virtual_path,
+                                                    name_tag=item.folder_tag)
+                            return process_word_file(source, output_dir, duplicate_index=duplicate_index,
+                                                     source_name=item.virtual_path, name_tag=item.folder_tag)
+                    finally:
+                        self.redirect.set_current_file(None)
+                
+                # 进度按实际完成的文件数更新，不等待作者顺序靠前的大文件
+                completed = 0
+                completed_lock = threading.Lock()
+                
+                def item_finished(item, result, seconds):
+                    nonlocal completed
+                    with completed_lock:
+                        completed += 1
+                        if not scheduler.paused and not scheduler.cancelled:
+                            self.progress_var.set(f"已完成 {completed}/{total_files} 个文件...")
+                
+                # 日志按作者顺序输出
+                def item_done(item, result, seconds):
+                    if isinstance(result, Exception):
+                        self.redirect.set_current_file(item.virtual_path)
+                        print(f"× 处理文件时出现错误：{str(result)}")
+                        self.redirect.set_current_file(None)
+                    self.redirect.flush_file(item.virtual_path)
+                
+                skipped_items = scheduler.run(process_item, item_done, on_finish=item_finished)
+                try:
+                    scheduler.history.save(history_path)
+                except Exception as e:
+                    print(f"! 保存处理耗时记录时出错：{str(e)}")
+                
+                # 查找疑似重复的文章
+                self.progress_var.set("正在查找疑似重复的文章...")
+                duplicate_pairs = duplicate_index.find_duplicates()
+                report_path = os.path.join(output_dir, "疑似重复报告.txt")
+                try:
+                    write_duplicate_report(duplicate_pairs, duplicate_index, report_path)
+                    duplicate_index.save()
+                except Exception as e:
+                    print(f"× 保存查重结果时出错：{str(e)}")
+                
+                slow_files = profiler.finish() if profiler else []
                 
                 # 处理完成后显示统计信息
                 success_count = len(self.redirect.get_success_files())
                 failed_count = len(self.redirect.get_error_files())
                 
                 summary = f"\n处理完成！\n总计: {total_files} 个文件\n成功: {success_count} 个\n失败: {failed_count} 个\n"
+                if skipped_items:
+                    summary += f"已取消: {len(skipped_items)} 个文件未处理\n"
                 if failed_count > 0:
                     summary += "\n失败的文件作者数字:\n"
-                    for failed_file in self.redirect.get_error_files():
-                        author_num = extract_author_number(failed_file)
+                    failed_files = sorted(self.redirect.get_error_files(),
+                                          key=lambda x: (extract_author_number(os.path.basename(x)), x))
+                    for failed_file in failed_files:
+                        author_num = extract_author_number(os.path.basename(failed_file))
                         summary += f"作者{author_num}\n"
                 
+                if duplicate_index.failed:
+                    summary += f"\n{len(duplicate_index.failed)} 个文件转换成功但未能加入查重索引:\n"
+                    for key, reason in sorted(duplicate_index.failed):
+                        summary += f"{key}: {reason}\n"
+                
+                if duplicate_pairs:
+                    summary += f"\n发现 {len(duplicate_pairs)} 对疑似重复的文章（详见 {report_path}）:\n"
+                    for a, b, similarity in duplicate_pairs[:20]:
+                        summary += f"{similarity:.0%}  {a}  <->  {b}\n"
+                
+                if slow_files:
+                    summary += f"\n耗时异常的文件（性能数据保存在 {profiler.profile_dir}）:\n"
+                    for slow_file in slow_files:
+                        summary += f"{slow_file.name}  {slow_file.size / 1024:.0f} KB  {slow_file.seconds:.2f}s\n"
+                        for line in slow_file.hot_functions[:3]:
+                            summary += f"    {line}\n"
+                
                 self.log_text.insert('end', summary)
                 self.log_text.see('end')
                 
@@ -249,6 +422,10 @@ class App:
         threading.Thread(target=conversion_thread, daemon=True).start()
 
     def conversion_complete(self):
+        self.scheduler = None
+        self.pause_btn.config(text="暂停")
+        self.pause_btn.state(['disabled'])
+        self.cancel_btn.state(['disabled'])
         success_count = len(self.redirect.get_success_files())
         failed_count = len(self.redirect.get_error_files())
         self.progress_var.set(f"处理完成，成功: {success_count} 个，失败: {failed_count} 个")
@@ -257,6 +434,9 @@ class App:
             self.pack_error_btn.state(['!disabled'])
 
     def conversion_error(self, error_message):
+        self.scheduler = None
+        self.pause_btn.state(['disabled'])
+        self.cancel_btn.state(['disabled'])
         self.progress_var.set(f"处理出错: {error_message}")
         self.convert_btn.state(['!disabled'])
         # 只检查错误文件
@@ -286,19 +466,21 @@ class App:
                 os.makedirs(images_dir, exist_ok=True)
                 
                 # 获取所有Word文件
-                docx_files = [f for f in os.listdir(input_dir) if f.endswith('.docx')]
+                docx_files = scan_inputs(input_dir, exclude_dirs=[output_dir])
                 total_images = 0
                 
-                for filename in docx_files:
-                    input_file = os.path.join(input_dir, filename)
-                    # 为每个文件创建子文件夹
-                    file_images_dir = os.path.join(images_dir, os.path.splitext(filename)[0])
+                for item in docx_files:
+                    filename = item.virtual_path
+                    # 为每个文件创建子文件夹，保留原有的文件夹层级
+                    file_images_dir = os.path.join(images_dir, *os.path.splitext(filename)[0].split('/'))
                     os.makedirs(file_images_dir, exist_ok=True)
                     
                     # 提取图片
-                    temp_images = extract_images_from_doc(input_file, file_images_dir)
+                    with item.open() as source:
+                        temp_images = extract_images_from_doc(source, file_images_dir)
                     if temp_images:
-                        self.log_text.insert('end', f"✓ {filename}: 提取了 {len(temp_images)} 张图片\n")
+                        images_size = sum(os.path.getsize(path) for path in temp_images)
+                        self.log_text.insert('end', f"✓ {filename}: 提取了 {len(temp_images)} 张图片（{images_size / 1024:.0f} KB）\n")
                         total_images += len(temp_images)
                     else:
                         self.log_text.insert('end', f"! {filename}: 未找到图片\n")
@@ -334,13 +516,14 @@ class App:
         def extract_thread():
             try:
                 # 获取所有Word文件
-                docx_files = [f for f in os.listdir(input_dir) if f.endswith('.docx')]
+                docx_files = scan_inputs(input_dir)
                 titles = []
                 
-                for filename in docx_files:
-                    input_file = os.path.join(input_dir, filename)
+                for item in docx_files:
+                    filename = item.virtual_path
                     try:
-                        doc = Document(input_file)
+                        with item.open() as source:
+                            doc = Document(source)
                         # 获取第一个非空段落作为标题
                         for para in doc.paragraphs:
                             if para.text.strip():
@@ -350,7 +533,7 @@ class App:
                         self.log_text.insert('end', f"× {filename}: 提取标题失败 - {str(e)}\n")
                 
                 # 按文件名排序
-                titles.sort(key=lambda x: extract_author_number(x[0]))
+                titles.sort(key=lambda x: extract_author_number(os.path.basename(x[0])))
                 
                 # 显示标题
                 self.log_text.insert('end', "提取的标题：\n" + "="*50 + "\n\n")
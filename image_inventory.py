@@ -0,0 +1,106 @@
+import posixpath
+import zipfile
+from collections import namedtuple
+from urllib.parse import unquote
+import xml.etree.ElementTree as ET
+
+CONTENT_TYPES_NS = '{http://schemas.openxmlformats.org/package/2006/content-types}'
+RELATIONSHIPS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# 媒体关系类型的后缀（图片、视频、音频及 Office 2010 的 media 关系）
+MEDIA_REL_SUFFIXES = ('/image', '/video', '/audio', '/media')
+
+# 媒体部件：部件名、内容类型、解压后大小、压缩后大小、引用它的部件列表
+MediaPart = namedtuple('MediaPart', ['partname', 'content_type', 'size', 'compressed_size', 'sources'])
+
+def is_image(media_part):
+    """判断媒体部件是否为图片"""
+    return media_part.content_type.startswith('image/')
+
+def _read_content_types(zf):
+    """解析 [Content_Types].xml，返回 (扩展名->类型, 部件名->类型)"""
+    defaults = {}
+    overrides = {}
+    try:
+        root = ET.fromstring(zf.read('[Content_Types].xml'))
+    except KeyError:
+        return defaults, overrides
+    for elem in root:
+        if elem.tag == CONTENT_TYPES_NS + 'Default':
+            defaults[elem.get('Extension', '').lower()] = elem.get('ContentType', '')
+        elif elem.tag == CONTENT_TYPES_NS + 'Override':
+            overrides[elem.get('PartName', '').lstrip('/')] = elem.get('ContentType', '')
+    return defaults, overrides
+
+def _content_type(partname, defaults, overrides):
+    if partname in overrides:
+        return overrides[partname]
+    ext = posixpath.splitext(partname)[1].lstrip('.').lower()
+    return defaults.get(ext, '')
+
+def _rels_source(rels_name):
+    """由关系部件名得到其所属部件名，如 word/_rels/document.xml.rels -> word/document.xml"""
+    folder, name = posixpath.split(rels_name)
+    return posixpath.join(posixpath.dirname(folder), name[:-len('.rels')])
+
+def _resolve_target(source, target):
+    target = unquote(target)
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+def read_media_inventory(source):
+    """
+    直接从压缩包读取媒体部件清单，不构建段落/文字块对象模型
+    覆盖正文、页眉、页脚、文本框、脚注等所有部件引用的图片和音视频
+    source: 文件路径或可 seek 的文件对象
+    返回按首次引用顺序排列的 MediaPart 列表
+    """
+    with zipfile.ZipFile(source) as zf:
+        infos = {info.filename: info for info in zf.infolist()}
+        defaults, overrides = _read_content_types(zf)
+
+        # 先处理正文的关系，使图片顺序与原先只读正文关系时一致
+        rels_names = [name for name in infos if name.endswith('.rels')]
+        rels_names.sort(key=lambda name: (name != 'word/_rels/document.xml.rels', name))
+
+        sources = {}
+        for rels_name in rels_names:
+            source_part = _rels_source(rels_name)
+            try:
+                root = ET.fromstring(zf.read(rels_name))
+            except ET.ParseError:
+                continue
+            for rel in root.iter(RELATIONSHIPS_NS + 'Relationship'):
+                if rel.get('TargetMode') == 'External':
+                    continue
+                if not rel.get('Type', '').endswith(MEDIA_REL_SUFFIXES):
+                    continue
+                partname = _resolve_target(source_part, rel.get('Target', ''))
+                if partname not in infos:
+                    continue
+                part_sources = sources.setdefault(partname, [])
+                if source_part not in part_sources:
+                    part_sources.append(source_part)
+
+        # 未被引用但存放在 word/ 下的媒体文件也列出来，便于核对
+        for name in infos:
+            if name in sources or not name.startswith('word/'):
+                continue
+            if _content_type(name, defaults, overrides).startswith(('image/', 'video/', 'audio/')):
+                sources[name] = []
+
+        return [
+            MediaPart(
+                partname,
+                _content_type(partname, defaults, overrides),
+                infos[partname].file_size,
+                infos[partname].compress_size,
+                tuple(part_sources),
+            )
+            for partname, part_sources in sources.items()
+        ]
+
+def referenced_images(inventory):
+    """返回被文档部件实际引用的图片"""
+    return [part for part in inventory if is_image(part) and part.sources]
@@ -0,0 +1,166 @@
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+import posixpath
+import contextlib
+
+# 程序自己生成的输出文件夹，输出目录与输入目录相同时不能当作输入再扫描一遍
+OUTPUT_DIR_NAMES = {"成功文件", "无图片成功文件", "错误文件", "提取的图片", "temp_images", "性能分析"}
+
+# 压缩包成员读出时最多在内存中保留的大小，超出部分写入临时文件
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+def _is_docx_name(name):
+    basename = posixpath.basename(name)
+    return (basename.lower().endswith('.docx')
+            and not basename.startswith('~$')
+            and not basename.startswith('._'))
+
+def _member_name(info):
+    """
+    返回压缩包成员的文件名
+    未设置 UTF-8 标志的文件名会被 zipfile 按 cp437 解码：Info-ZIP（Linux/macOS 的 zip）等工具写入的
+    是 UTF-8 但不设标志，Windows 自带压缩写入的是 GBK，因此先按 UTF-8 还原，失败再按 GBK
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        raw = info.filename.encode('cp437')
+    except UnicodeEncodeError:
+        return info.filename
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return info.filename
+
+class WorkItem:
+    """
+    一个待处理的 Word 文件：磁盘上的文件，或压缩包中的成员
+    virtual_path 为相对输入目录、以 / 分隔的稳定路径，压缩包成员形如 “批次.zip/子目录/文件.docx”
+    """
+
+    def __init__(self, virtual_path, size, path=None, archive_path=None, member=None):
+        self.virtual_path = virtual_path
+        self.size = size
+        self.path = path
+        self.archive_path = archive_path
+        self.member = member
+
+    @property
+    def name(self):
+        return posixpath.basename(self.virtual_path)
+
+    @property
+    def folder_tag(self):
+        """所在子目录或压缩包的标记，如 “批次.zip_子目录”，直接位于输入目录下时为空字符串"""
+        folder = posixpath.dirname(self.virtual_path)
+        return re.sub(r'[\\/:*?"<>|]', '_', folder)
+
+    @contextlib.contextmanager
+    def open(self, spool_max_size=SPOOL_MAX_SIZE):
+        """
+        打开文件供处理：磁盘文件直接给出路径，压缩包成员给出文件对象
+        压缩包成员虽然也能直接 seek，但无论是否压缩，每次向回跳都要回到成员开头重新读取（并重新校验 CRC），
+        而打开和保存 Word 文档会在各部件之间反复跳转，因此先把成员复制到临时文件对象：
+        不超过 spool_max_size 的保留在内存中，更大的写入磁盘，内存占用不随成员大小增长
+        """
+        if self.path is not None:
+            yield self.path
+            return
+        stream = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+        try:
+            with zipfile.ZipFile(self.archive_path) as zf, zf.open(self.member) as src:
+                shutil.copyfileobj(src, stream)
+            stream.seek(0)
+        except Exception:
+            stream.close()
+            raise
+        try:
+            yield stream
+        finally:
+            stream.close()
+
+    def copy_to(self, dst_path):
+        """将原始文件复制到 dst_path（压缩包成员按块写出）"""
+        if self.path is not None:
+            shutil.copy2(self.path, dst_path)
+            return
+        with zipfile.ZipFile(self.archive_path) as zf, zf.open(self.member) as src, open(dst_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+def _safe_member_path(name):
+    """
+    将压缩包成员名规范为以 / 分隔的相对路径
+    绝对路径、带盘符或含 .. 的成员名会让复制和提取图片时写到输出目录之外，返回 None
+    """
+    name = name.replace('\\', '/')
+    if name.startswith('/') or re.match(r'^[A-Za-z]:', name):
+        return None
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    return '/'.join(parts)
+
+def _scan_archive(archive_path, virtual_prefix, items):
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                    continue
+                name = _member_name(info)
+                if not _is_docx_name(name):
+                    continue
+                safe_name = _safe_member_path(name)
+                if safe_name is None:
+                    print(f"! 跳过压缩包 '{virtual_prefix}' 中路径不安全的文件：{name}")
+                    continue
+                name = safe_name
+                items.append(WorkItem(f"{virtual_prefix}/{name}", info.file_size,
+                                      archive_path=archive_path, member=info.filename))
+    except (zipfile.BadZipFile, OSError) as e:
+        print(f"× 无法读取压缩包 '{virtual_prefix}'：{str(e)}")
+
+def scan_inputs(input_dir, exclude_dirs=()):
+    """
+    一次遍历输入目录及其所有子目录，收集 .docx 文件和 .zip 压缩包中的 .docx 成员
+    使用 os.scandir，文件大小取自目录项缓存的 stat 结果
+    exclude_dirs 中的目录（如输出目录）及程序生成的输出文件夹不会被扫描
+    返回 WorkItem 列表
+    """
+    excluded = {os.path.normcase(os.path.abspath(path)) for path in exclude_dirs if path}
+    root = os.path.abspath(input_dir)
+    excluded.discard(os.path.normcase(root))
+    items = []
+    stack = [(root, '')]
+    while stack:
+        folder, prefix = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"× 无法读取文件夹 '{prefix or folder}'：{str(e)}")
+            continue
+        subfolders = []
+        for entry in entries:
+            virtual_path = f"{prefix}{entry.name}"
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if (entry.name in OUTPUT_DIR_NAMES or entry.name.startswith('.')
+                            or os.path.normcase(entry.path) in excluded):
+                        continue
+                    subfolders.append((entry.path, virtual_path + '/'))
+                elif entry.is_file():
+                    lower_name = entry.name.lower()
+                    if _is_docx_name(entry.name):
+                        items.append(WorkItem(virtual_path, entry.stat().st_size, path=entry.path))
+                    elif lower_name.endswith('.zip'):
+                        _scan_archive(entry.path, virtual_path, items)
+            except OSError:
+                continue
+        # 倒序压栈，使子目录按名称顺序展开
+        stack.extend(reversed(subfolders))
+    return items
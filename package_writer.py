@@ -0,0 +1,108 @@
+import os
+import time
+import shutil
+import zipfile
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+
+# 已经压缩过的媒体直接存储，不再 deflate（再次压缩几乎不会变小，只会浪费CPU）
+STORED_CONTENT_TYPES = (
+    'image/jpeg',
+    'image/png',
+    'image/gif',
+    'image/webp',
+    'video/',
+    'audio/',
+)
+
+# XML 等文本部件的 deflate 压缩级别（1 最快，9 最小）
+XML_COMPRESS_LEVEL = 6
+
+# 流式复制大部件时每次读写的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def compression_for(content_type, xml_level=XML_COMPRESS_LEVEL, stored_types=STORED_CONTENT_TYPES):
+    """根据内容类型返回 (压缩方式, 压缩级别)"""
+    if content_type.startswith(stored_types):
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, xml_level
+
+def _write_member(zf, membername, data, compress_type, level, date_time):
+    zinfo = zipfile.ZipInfo(membername, date_time=date_time)
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    zf.writestr(zinfo, data, compresslevel=level)
+
+def copy_member(src_zf, src_name, dst_zf, dst_name, compress_type, date_time,
+                chunk_size=COPY_CHUNK_SIZE):
+    """
+    在两个压缩包之间按固定大小的块复制一个部件，内存占用与部件大小无关
+    需要 deflate 时使用 zlib 默认压缩级别
+    """
+    zinfo = zipfile.ZipInfo(dst_name, date_time=date_time)
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    # 预先给出大小，超过 2GB 的部件会自动使用 zip64
+    zinfo.file_size = src_zf.getinfo(src_name).file_size
+    with src_zf.open(src_name) as src, dst_zf.open(zinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, chunk_size)
+
+def copy_package_without(source, dest, skip_parts):
+    """
+    复制整个压缩包，skip_parts 中的部件以空内容代替
+    用于在不把超大媒体读入内存的情况下用 python-docx 打开原文档
+    """
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(dest, 'w') as dst:
+        for info in src.infolist():
+            if info.filename in skip_parts:
+                dst.writestr(info.filename, b'')
+            else:
+                copy_member(src, info.filename, dst, info.filename, info.compress_type, info.date_time)
+
+def save_document(doc, output_file, xml_level=XML_COMPRESS_LEVEL, stored_types=STORED_CONTENT_TYPES,
+                  streamed_parts=None):
+    """
+    按内容类型选择压缩策略保存 python-docx 文档，替代 doc.save()
+    图片、音视频直接存储，XML 按 xml_level 压缩；每个部件序列化后立即写入输出文件
+    streamed_parts: {部件名: (源压缩包, 源部件名)}，这些部件不使用 part.blob，
+    而是从源压缩包分块复制
+    """
+    streamed_parts = streamed_parts or {}
+    sources = {}
+    package = doc.part.package
+    parts = list(package.parts)
+    for part in parts:
+        part.before_marshal()
+
+    date_time = time.localtime()[:6]
+    try:
+        with zipfile.ZipFile(output_file, 'w') as zf:
+            # 内容类型和包关系与 python-docx 自身保存时生成的完全一致
+            _write_member(zf, CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob,
+                          zipfile.ZIP_DEFLATED, xml_level, date_time)
+            _write_member(zf, PACKAGE_URI.rels_uri.membername, package.rels.xml,
+                          zipfile.ZIP_DEFLATED, xml_level, date_time)
+            for part in parts:
+                compress_type, level = compression_for(part.content_type, xml_level, stored_types)
+                if part.partname in streamed_parts:
+                    source, src_name = streamed_parts[part.partname]
+                    if source not in sources:
+                        sources[source] = zipfile.ZipFile(source)
+                    copy_member(sources[source], src_name, zf, part.partname.membername,
+                                compress_type, date_time)
+                else:
+                    _write_member(zf, part.partname.membername, part.blob, compress_type, level, date_time)
+                if len(part.rels):
+                    _write_member(zf, part.partname.rels_uri.membername, part.rels.xml,
+                                  zipfile.ZIP_DEFLATED, xml_level, date_time)
+    except Exception:
+        # 不留下写了一半的文件
+        if isinstance(output_file, str) and os.path.exists(output_file):
+            try:
+                os.remove(output_file)
+            except OSError:
+                pass
+        raise
+    finally:
+        for src_zf in sources.values():
+            src_zf.close()
@@ -3,12 +3,32 @@ from docx.shared import Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 import re
 import os
+import io
 import sys
+import posixpath
+import zipfile
 from zipfile import BadZipFile
 from docx.oxml.ns import qn
 from docx.shared import Inches
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.oxml.shape import CT_Inline
+from docx.image.image import Image
+from docx.parts.image import ImagePart
 import shutil
+import tempfile
 from docx2python import docx2python
+from image_inventory import read_media_inventory, referenced_images
+from package_writer import save_document, copy_package_without, COPY_CHUNK_SIZE
+from input_scanner import scan_inputs
+from template_cache import new_document
+
+# 解压后超过此大小的媒体部件不读入内存，改为在压缩包之间分块复制
+LARGE_PART_SIZE = 16 * 1024 * 1024
+# 处理单个文档时允许占用的内存估算上限，超出时拒绝处理
+MEMORY_BUDGET = 512 * 1024 * 1024
+# 读取超大图片尺寸时预读的头部大小
+IMAGE_HEAD_SIZE = 256 * 1024
 
 def extract_author_number(filename):
     """从文件名中提取作者数字"""
@@ -26,59 +46,30 @@ def extract_author_from_filename(filename):
         pass
     return None
 
-def has_images_in_doc(doc):
-    """
-    检查Word文档中是否包含图片
-    """
-    try:
-        for para in doc.paragraphs:
-            for run in para.runs:
-                try:
-                    # 检查内联图片
-                    if run._element.findall('.//wp:inline', namespaces={'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'}):
-                        return True
-                    # 检查锚定图片
-                    if run._element.findall('.//wp:anchor', namespaces={'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'}):
-                        return True
-                    # 检查图形对象
-                    if run._element.findall('.//w:drawing', namespaces={'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
-                        return True
-                except Exception:
-                    # 忽略单个图片的检查错误
-                    continue
-        return False
-    except Exception:
-        # 如果整个检查过程出错，假设文档包含图片
-        return True
-
-def extract_images_from_doc(input_path, temp_dir):
+def extract_images_from_doc(input_path, temp_dir, skip_parts=()):
     """
-    直接从Word文档关系中提取图片
+    直接从Word压缩包中提取图片
+    根据 [Content_Types].xml 和所有关系部件定位图片，包括页眉、页脚、表格和文本框中的图片
+    图片按块写入临时文件，不整体读入内存；skip_parts 中的部件不提取
     """
     try:
-        doc = Document(input_path)
         temp_image_files = []
+        inventory = read_media_inventory(input_path)
         
-        # 获取文档中的所有关系
-        rels = doc.part.rels
-        
-        for rel in rels.values():
-            # 检查是否是图片
-            if "image" in rel.target_ref:
+        with zipfile.ZipFile(input_path) as zf:
+            for media_part in referenced_images(inventory):
+                if media_part.partname in skip_parts:
+                    continue
                 try:
-                    # 获取图片数据
-                    image_part = rel.target_part
-                    image_data = image_part.blob
-                    
-                    # 从目标引用中获取图片扩展名
-                    image_ext = os.path.splitext(rel.target_ref)[1]
+                    # 从部件名中获取图片扩展名
+                    image_ext = os.path.splitext(media_part.partname)[1]
                     if not image_ext:
                         image_ext = '.png'  # 默认使用png
                     
                     # 保存图片
                     temp_image_path = os.path.join(temp_dir, f"image_{len(temp_image_files)}{image_ext}")
-                    with open(temp_image_path, 'wb') as f:
-                        f.write(image_data)
+                    with zf.open(media_part.partname) as src, open(temp_image_path, 'wb') as f:
+                        shutil.copyfileobj(src, f, COPY_CHUNK_SIZE)
                     temp_image_files.append(temp_image_path)
                 except Exception as e:
                     print(f"保存图片时出错：{str(e)}")
@@ -89,12 +80,60 @@ def extract_images_from_doc(input_path, temp_dir):
         print(f"提取图片时出错：{str(e)}")
         return []
 
-def process_word_file(input_file, output_dir):
-    """处理单个Word文件"""
-    print(f"DEBUG: 开始处理文件 {input_file}")
+def plan_document_memory(input_file, memory_budget=MEMORY_BUDGET, large_part_size=LARGE_PART_SIZE):
+    """
+    根据压缩包中各部件解压后的大小规划内存
+    超过 large_part_size 的媒体部件走流式复制；其余部件在原文档和新文档中各驻留一份，按两倍估算
+    返回 (需要流式复制的部件名集合, 拒绝原因)，可以处理时拒绝原因为 None
+    """
+    with zipfile.ZipFile(input_file) as zf:
+        infos = zf.infolist()
+    streamed = {info.filename for info in infos
+                if info.file_size >= large_part_size and not info.filename.endswith(('.xml', '.rels'))}
+    resident = sum(info.file_size for info in infos if info.filename not in streamed) * 2
+    if resident > memory_budget:
+        mb = 1024 * 1024
+        return streamed, f"解压后需要约 {resident / mb:.0f} MB 内存，超出单个文档的内存预算 {memory_budget / mb:.0f} MB"
+    return streamed, None
+
+def add_streamed_picture(new_doc, run, source, member, width, streamed_parts):
+    """
+    向新文档添加超大图片而不把图片读入内存
+    只解析图片头部获取尺寸，图片数据在 save_document 保存时从源压缩包分块复制
+    """
+    with zipfile.ZipFile(source) as zf, zf.open(member) as stream:
+        # 解析 PNG 等格式时会向后跳过大块数据，限制每次跳读的块大小
+        stream.MAX_SEEK_READ = COPY_CHUNK_SIZE
+        head = stream.read(IMAGE_HEAD_SIZE)
+        stream.seek(0)
+        image = Image._from_stream(stream, head, posixpath.basename(member))
+    partname = PackURI(f"/word/media/large{len(streamed_parts) + 1}.{image.ext}")
+    image_part = ImagePart.from_image(image, partname)
+    rId = new_doc.part.relate_to(image_part, RT.IMAGE)
+    cx, cy = image.scaled_dimensions(width, None)
+    inline = CT_Inline.new_pic_inline(new_doc.part.next_id, rId, image.filename, cx, cy)
+    run._r.add_drawing(inline)
+    streamed_parts[partname] = (source, member)
+
+def process_word_file(input_file, output_dir, duplicate_index=None,
+                      memory_budget=MEMORY_BUDGET, large_part_size=LARGE_PART_SIZE, source_name=None,
+                      name_tag=''):
+    """
+    处理单个Word文件
+    input_file: 文件路径，或可随机访问的文件对象（如压缩包中的成员）
+    duplicate_index: 可选的查重索引（DuplicateIndex），处理成功后将正文加入索引
+    memory_budget / large_part_size: 单个文档的内存预算和走流式复制的部件大小
+    source_name: 报告中使用的名称，如压缩包成员的虚拟路径；默认为 input_file
+    name_tag: 附加在输出文件名末尾的标记（如 WorkItem.folder_tag），避免不同子目录或压缩包中
+    作者和标题相同的文件互相覆盖；为空时输出文件名与以前相同
+    """
+    if source_name is None:
+        source_name = input_file if isinstance(input_file, str) else getattr(input_file, 'name', '')
+    print(f"DEBUG: 开始处理文件 {source_name}")
+    temp_dir = None
     try:
         # 检查文件是否存在
-        if not os.path.exists(input_file):
+        if isinstance(input_file, str) and not os.path.exists(input_file):
             print(f"× 错误：输入文件 '{input_file}' 不存在")
             return False
 
@@ -104,32 +143,52 @@ def process_word_file(input_file, output_dir):
         os.makedirs(success_dir, exist_ok=True)
         os.makedirs(no_image_dir, exist_ok=True)
 
-        # 创建临时文件夹存储图片
-        temp_dir = os.path.join(output_dir, "temp_images")
-        os.makedirs(temp_dir, exist_ok=True)
+        # 创建临时文件夹存储图片：每个文件在系统临时目录下单独一个，多个文件同时处理时互不影响
+        temp_dir = tempfile.mkdtemp(prefix='temp_images_')
 
-        # 打开文档
+        # 估算内存：超大媒体改走流式复制，仍超出预算的文档直接拒绝
         try:
-            doc = Document(input_file)
+            streamed_names, reject_reason = plan_document_memory(input_file, memory_budget, large_part_size)
         except BadZipFile:
-            print(f"× 错误：文件 '{input_file}' 可能已损坏或不是有效的Word文档")
+            print(f"× 错误：文件 '{source_name}' 可能已损坏或不是有效的Word文档")
+            return False
+        if reject_reason:
+            print(f"× 错误：文件 '{source_name}' {reject_reason}")
+            return False
+
+        # 打开文档（含超大媒体时打开去掉这些媒体的副本）
+        try:
+            if streamed_names:
+                slim_copy = io.BytesIO()
+                copy_package_without(input_file, slim_copy, streamed_names)
+                doc = Document(slim_copy)
+            else:
+                doc = Document(input_file)
+        except BadZipFile:
+            print(f"× 错误：文件 '{source_name}' 可能已损坏或不是有效的Word文档")
             return False
 
-        # 创建新文档
-        new_doc = Document()
+        # 创建新文档（复制缓存的空白模板，不再每次重新解析 default.docx）
+        new_doc = new_document()
         temp_image_files = []
         author_name = ""
         original_title = ""
         title_found = False
         author_added = False  # 添加标志，防止重复添加作者信息
+        body_texts = []  # 收集正文，供查重使用
 
         # 从文件名中提取作者名
-        filename = os.path.basename(input_file)
+        filename = os.path.basename(source_name)
         author_name = extract_author_from_filename(filename)
 
-        # 提取图片
-        temp_image_files = extract_images_from_doc(input_file, temp_dir)
-        has_images = len(temp_image_files) > 0
+        # 提取图片（超大图片不落地，保存时直接从原压缩包复制）
+        temp_image_files = extract_images_from_doc(input_file, temp_dir, skip_parts=streamed_names)
+        large_images = []
+        if streamed_names:
+            large_images = [media_part.partname for media_part in referenced_images(read_media_inventory(input_file))
+                            if media_part.partname in streamed_names]
+        streamed_parts = {}
+        has_images = len(temp_image_files) > 0 or len(large_images) > 0
 
         # 处理文档内容
         for para in doc.paragraphs:
@@ -185,13 +244,14 @@ def process_word_file(input_file, output_dir):
                     text_run.font.size = Pt(12)
                     text_run.font.name = '宋体'
                     text_run._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
+                    body_texts.append(text)
 
             except Exception as e:
                 print(f"× 处理段落时出错：{str(e)}")
                 continue
 
         # 在文档末尾添加图片
-        if temp_image_files:
+        if has_images:
             new_doc.add_paragraph()  # 添加空行
             for image_path in temp_image_files:
                 try:
@@ -202,16 +262,29 @@ def process_word_file(input_file, output_dir):
                 except Exception as e:
                     print(f"× 添加图片时出错：{str(e)}")
                     continue
+            # 超大图片放在其余图片之后
+            for member in large_images:
+                try:
+                    img_para = new_doc.add_paragraph()
+                    img_para.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+                    run = img_para.add_run()
+                    add_streamed_picture(new_doc, run, input_file, member, Inches(6), streamed_parts)
+                except Exception as e:
+                    print(f"× 添加图片时出错：{str(e)}")
+                    continue
 
         # 保存新文档
         if author_name and original_title:
-            new_filename = f"({author_name}){original_title}——福州大学先进制造学院与海洋学院关工委2023年'中华魂'（毛泽东伟大精神品格）主题教育征文.docx"
+            new_filename = f"({author_name}){original_title}——福州大学先进制造学院与海洋学院关工委2023年'中华魂'（毛泽东伟大精神品格）主题教育征文"
+            if name_tag:
+                new_filename += f"[{name_tag}]"
+            new_filename += ".docx"
             # 根据是否有图片选择保存目录
             output_dir_final = success_dir if has_images else no_image_dir
             output_file = os.path.join(output_dir_final, new_filename)
             
             try:
-                new_doc.save(output_file)
+                save_document(new_doc, output_file, streamed_parts=streamed_parts)
                 if has_images:
                     print(f"✓ 文件处理完成：{new_filename}")
                 else:
@@ -226,23 +299,22 @@ def process_word_file(input_file, output_dir):
                 print("× 未能提取标题")
             return False
 
-        # 清理临时文件
-        for temp_file in temp_image_files:
+        # 加入查重索引（文件本身已转换成功，出错时记入索引的失败列表，在批次摘要中报告，不算作失败文件）
+        if duplicate_index is not None:
             try:
-                os.remove(temp_file)
-            except:
-                pass
-        try:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-        except:
-            pass
+                duplicate_index.add(source_name, '\n'.join(body_texts))
+            except Exception as e:
+                duplicate_index.failed.append((source_name, str(e)))
 
         return True
 
     except Exception as e:
         print(f"× 处理文件时出现错误：{str(e)}")
         return False
+    finally:
+        # 清理临时文件
+        if temp_dir and os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
 def open_word_doc(input_path):
     """
@@ -269,36 +341,27 @@ def open_word_doc(input_path):
                 return None, f"无法打开文件：{error_msg}"
 
 def process_folder(input_folder, output_folder):
-    """处理文件夹中的所有Word文档"""
+    """处理文件夹（含子文件夹和 .zip 压缩包）中的所有Word文档"""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
-    temp_dir = os.path.join(output_folder, "temp_images")
-    
     try:
-        for filename in os.listdir(input_folder):
-            if filename.startswith('~$') or not filename.endswith('.docx'):
-                continue
-                
+        for item in scan_inputs(input_folder, exclude_dirs=[output_folder]):
             if hasattr(sys.stdout, 'set_current_file'):
-                sys.stdout.set_current_file(filename)
+                sys.stdout.set_current_file(item.virtual_path)
             if hasattr(sys.stderr, 'set_current_file'):
-                sys.stderr.set_current_file(filename)
+                sys.stderr.set_current_file(item.virtual_path)
                 
-            input_path = os.path.join(input_folder, filename)
-            print(f"\n处理文件：{filename}")
+            print(f"\n处理文件：{item.virtual_path}")
             
             # 处理文档
-            process_word_file(input_path, output_folder)
+            with item.open() as source:
+                process_word_file(source, output_folder, source_name=item.virtual_path,
+                                  name_tag=item.folder_tag)
                     
     except Exception as e:
         print(f"× 处理文件夹时发生错误：{str(e)}")
     finally:
-        if os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
         if hasattr(sys.stdout, 'set_current_file'):
             sys.stdout.set_current_file(None)
         if hasattr(sys.stderr, 'set_current_file'):
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from image_inventory import read_media_inventory, referenced_images
+
+# 默认工作线程数：zip 解压/压缩和 lxml 解析/序列化时会释放 GIL，少量线程即可重叠大文件的耗时
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+HISTORY_FILENAME = "处理耗时记录.json"
+
+# 没有历史记录时的成本模型（秒）：固定开销 + 每 MB + 每张图片
+BASE_SECONDS = 0.05
+SECONDS_PER_MB = 0.05
+SECONDS_PER_IMAGE = 0.05
+
+def count_images(item):
+    """
+    统计文档引用的图片数，用于估算处理成本
+    限制：压缩包中的成员需要先解压才能读取，估算阶段不统计，一律按 0 张图片计算，
+    这类文件首次处理时只按大小估算，处理过一次后使用历史耗时
+    """
+    if item.path is None:
+        return 0
+    try:
+        return len(referenced_images(read_media_inventory(item.path)))
+    except Exception:
+        return 0
+
+def _model_seconds(size, images):
+    return BASE_SECONDS + size / (1024 * 1024) * SECONDS_PER_MB + images * SECONDS_PER_IMAGE
+
+class TimingHistory:
+    """
+    记录历次处理每个文件的大小、图片数和耗时，用于估算下一批文件的处理成本
+    同一文件（虚拟路径和大小都相同）直接使用上次耗时；其他文件按历史数据校正成本模型
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.records = {}  # 虚拟路径 -> {"size": ..., "images": ..., "seconds": ...}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        history = cls(path)
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    history.records = json.load(f).get('records', {})
+            except Exception as e:
+                print(f"! 读取处理耗时记录时出错：{str(e)}")
+        return history
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'records': self.records}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def record(self, key, size, images, seconds):
+        with self._lock:
+            self.records[key] = {'size': size, 'images': images, 'seconds': round(seconds, 4)}
+
+    def _scale(self):
+        """实际耗时与模型估算之比，用于把模型校正到本机的处理速度"""
+        predicted = actual = 0.0
+        for record in self.records.values():
+            predicted += _model_seconds(record['size'], record.get('images', 0))
+            actual += record['seconds']
+        return actual / predicted if predicted and actual else 1.0
+
+    def lookup(self, key, size):
+        """返回同一文件（虚拟路径和大小都相同）上次的处理记录，没有时返回 None"""
+        record = self.records.get(key)
+        if record and record['size'] == size:
+            return record
+        return None
+
+    def estimator(self):
+        """返回估算函数 estimate(key, size, images) -> 秒"""
+        scale = self._scale()
+        records = dict(self.records)
+
+        def estimate(key, size, images):
+            record = records.get(key)
+            if record and record['size'] == size:
+                return record['seconds']
+            return _model_seconds(size, images) * scale
+        return estimate
+
+class BatchScheduler:
+    """
+    按估算成本从大到小调度批量任务，缩短整批的完成时间
+    任务在工作线程中执行，完成回调始终按传入 items 的原有顺序（如作者数字顺序）依次调用；
+    需要实时反映进度时使用 on_finish，它在每个文件处理完后立即在工作线程中调用
+    支持在 GUI 中协作式暂停和取消：已开始的文件会处理完，尚未开始的文件不再开始
+    """
+
+    def __init__(self, items, workers=DEFAULT_WORKERS, history=None, key=lambda item: item.virtual_path,
+                 initializer=None):
+        self.items = list(items)
+        self.workers = max(1, workers)
+        self.history = history if history is not None else TimingHistory()
+        self.key = key
+        self.initializer = initializer  # 工作线程启动时调用，如预热模板缓存
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._cancel_event = threading.Event()
+
+    def pause(self):
+        self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    def cancel(self):
+        self._cancel_event.set()
+        # 暂停中取消时也要让调度循环退出等待
+        self._resume_event.set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def plan(self):
+        """
+        返回 (原序号, 文件, 图片数, 估算秒数) 列表，按估算成本从大到小排列
+        有历史记录的文件直接使用记录中的图片数，不再打开；其余文件用 workers 个线程并行统计图片数
+        （压缩包成员不统计，见 count_images）
+        """
+        estimate = self.history.estimator()
+        images = {}
+        unknown = []
+        for index, item in enumerate(self.items):
+            record = self.history.lookup(self.key(item), item.size)
+            if record is not None:
+                images[index] = record.get('images', 0)
+            elif item.path is None:
+                images[index] = 0
+            else:
+                unknown.append(index)
+        if unknown:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                counts = executor.map(count_images, [self.items[index] for index in unknown])
+                images.update(zip(unknown, counts))
+
+        plan = []
+        for index, item in enumerate(self.items):
+            plan.append((index, item, images[index], estimate(self.key(item), item.size, images[index])))
+        plan.sort(key=lambda entry: (-entry[3], entry[0]))
+        return plan
+
+    def run(self, process, on_done, on_start=None, on_finish=None):
+        """
+        执行整批任务
+        process(item): 在工作线程中处理一个文件，返回值传给 on_done
+        on_done(item, result, seconds): 在调用 run 的线程中按原有顺序回调，异常时 result 为该异常
+        on_start(item): 可选，在工作线程中开始处理前调用
+        on_finish(item, result, seconds): 可选，每个文件处理完后立即在工作线程中调用，不等待排在前面的文件，
+        可能被多个线程同时调用
+        返回因取消而未处理的文件列表（按原有顺序）
+        """
+        pending = self.plan()
+        pending.reverse()  # 从末尾弹出成本最大的任务
+        finished = {}  # 原序号 -> (结果, 耗时)
+        next_index = 0
+
+        def task(item, images):
+            if on_start:
+                on_start(item)
+            start = time.perf_counter()
+            try:
+                result = process(item)
+            except Exception as e:
+                result = e
+            seconds = time.perf_counter() - start
+            self.history.record(self.key(item), item.size, images, seconds)
+            if on_finish:
+                on_finish(item, result, seconds)
+            return result, seconds
+
+        def emit_ready():
+            nonlocal next_index
+            while next_index in finished:
+                result, seconds = finished.pop(next_index)
+                on_done(self.items[next_index], result, seconds)
+                next_index += 1
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers, initializer=self.initializer) as executor:
+            while pending or running:
+                while pending and len(running) < self.workers and not self.cancelled:
+                    if self.paused:
+                        break
+                    index, item, images, _ = pending.pop()
+                    running[executor.submit(task, item, images)] = index
+                if self.cancelled:
+                    pending = []
+                if not running:
+                    if not pending:
+                        break
+                    # 暂停中且没有正在处理的文件，等待继续或取消
+                    self._resume_event.wait(0.2)
+                    continue
+                done, _ = wait(running, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[running.pop(future)] = future.result()
+                emit_ready()
+
+        # 取消后，已处理的文件仍按原有顺序回调
+        skipped = []
+        for index in range(next_index, len(self.items)):
+            if index in finished:
+                result, seconds = finished.pop(index)
+                on_done(self.items[index], result, seconds)
+            else:
+                skipped.append(self.items[index])
+        return skipped
@@ -0,0 +1,132 @@
+import os
+import re
+import time
+import shutil
+import cProfile
+import pstats
+import tempfile
+from collections import namedtuple
+
+# 默认保留耗时位于前 5% 的文件；耗时不足 MIN_SECONDS 的文件不保留，避免小批量时误报
+PERCENTILE = 95
+MIN_SECONDS = 1.0
+TOP_FUNCTIONS = 5
+
+# 一个已保留的慢文件：文件名、文件大小、耗时、性能数据路径、热点函数摘要
+SlowFile = namedtuple('SlowFile', ['name', 'size', 'seconds', 'profile_path', 'hot_functions'])
+
+def _safe_filename(name):
+    return re.sub(r'[\\/:*?"<>|]', '_', name)
+
+def _percentile(values, percentile):
+    """最近秩法计算百分位数"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percentile // 100))
+    return ordered[int(rank) - 1]
+
+def hot_functions(profile_path, limit=TOP_FUNCTIONS):
+    """读取性能数据，返回按自身耗时排序的热点函数描述"""
+    stats = pstats.Stats(profile_path).stats
+    ranked = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    result = []
+    for (filename, line, func), (cc, nc, tottime, cumtime, callers) in ranked:
+        location = f"{os.path.basename(filename)}:{line}" if line else filename
+        result.append(f"{func} ({location}) 自身 {tottime:.2f}s / 累计 {cumtime:.2f}s，调用 {nc} 次")
+    return result
+
+class SlowFileProfiler:
+    """
+    批量处理时记录每个文件的耗时，并对全部或抽样的文件进行性能分析
+    只保留慢于阈值（未给出阈值时按百分位）的文件的性能数据，其余的在 finish() 时删除
+    """
+
+    def __init__(self, output_dir, sample_every=1, threshold_seconds=None,
+                 percentile=PERCENTILE, min_seconds=MIN_SECONDS):
+        self.profile_dir = os.path.join(output_dir, "性能分析")
+        self.sample_every = max(1, sample_every)
+        self.threshold_seconds = threshold_seconds
+        self.percentile = percentile
+        self.min_seconds = min_seconds
+        self.records = []  # (文件名, 大小, 耗时, 临时性能数据路径或None)
+        self._pending_dir = None
+
+    def _should_profile(self):
+        return len(self.records) % self.sample_every == 0
+
+    def run(self, name, size, func, *args, **kwargs):
+        """执行 func(*args, **kwargs) 并记录耗时，按抽样设置决定是否同时进行性能分析"""
+        profile_path = None
+        if self._should_profile():
+            if self._pending_dir is None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                self._pending_dir = tempfile.mkdtemp(prefix='.pending_', dir=self.profile_dir)
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                result = profiler.runcall(func, *args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                profile_path = os.path.join(self._pending_dir, f"{len(self.records)}.prof")
+                profiler.dump_stats(profile_path)
+                self.records.append((name, size, seconds, profile_path))
+            return result
+
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.records.append((name, size, time.perf_counter() - start, None))
+
+    def _cutoff(self):
+        """
+        返回需要保留性能数据的最小耗时
+        给出 threshold_seconds 时只按阈值保留；否则按百分位保留，且不低于 min_seconds
+        """
+        if self.threshold_seconds is not None:
+            return self.threshold_seconds
+        if self.percentile is not None and self.records:
+            return max(_percentile([record[2] for record in self.records], self.percentile), self.min_seconds)
+        return float('inf')
+
+    def finish(self):
+        """
+        批次结束时调用：保留慢文件的性能数据并写出摘要，删除其余数据
+        返回按耗时从高到低排序的 SlowFile 列表
+        """
+        cutoff = self._cutoff()
+        slow_files = []
+        for name, size, seconds, pending_path in self.records:
+            if pending_path is None or seconds < cutoff:
+                continue
+            profile_path = os.path.join(self.profile_dir, f"{seconds:.2f}s_{_safe_filename(name)}.prof")
+            try:
+                shutil.move(pending_path, profile_path)
+                slow_files.append(SlowFile(name, size, seconds, profile_path, hot_functions(profile_path)))
+            except Exception as e:
+                print(f"! 保存性能数据时出错：{str(e)}")
+        slow_files.sort(key=lambda slow_file: slow_file.seconds, reverse=True)
+
+        if self._pending_dir is not None:
+            shutil.rmtree(self._pending_dir, ignore_errors=True)
+            self._pending_dir = None
+
+        if slow_files:
+            self._write_summary(slow_files, cutoff)
+        elif os.path.isdir(self.profile_dir) and not os.listdir(self.profile_dir):
+            os.rmdir(self.profile_dir)
+        return slow_files
+
+    def _write_summary(self, slow_files, cutoff):
+        times = [record[2] for record in self.records]
+        summary_path = os.path.join(self.profile_dir, "慢文件性能分析.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(f"共计时 {len(times)} 个文件，平均 {sum(times) / len(times):.2f}s，"
+                    f"保留耗时不少于 {cutoff:.2f}s 的 {len(slow_files)} 个文件\n")
+            f.write("=" * 50 + "\n\n")
+            for slow_file in slow_files:
+                f.write(f"{slow_file.name}\n")
+                f.write(f"  大小 {slow_file.size / 1024:.0f} KB，耗时 {slow_file.seconds:.2f}s\n")
+                f.write(f"  性能数据 {os.path.basename(slow_file.profile_path)}\n")
+                for line in slow_file.hot_functions:
+                    f.write(f"    {line}\n")
+                f.write("\n")
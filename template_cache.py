@@ -0,0 +1,50 @@
+import copy
+import threading
+from docx import Document
+from docx.opc.part import XmlPart
+
+_lock = threading.Lock()
+_pristine = None  # 只解析一次的空白模板，不对外暴露，也从不修改
+
+def _pristine_document():
+    global _pristine
+    if _pristine is None:
+        with _lock:
+            if _pristine is None:
+                _pristine = Document()
+    return _pristine
+
+def warm_template_cache():
+    """预先解析空白模板，可作为工作线程池的初始化函数"""
+    _pristine_document()
+
+def new_document():
+    """
+    返回一个新的空白文档，等价于 Document()
+    python-docx 每次 Document() 都会重新打开并解析自带的 default.docx；
+    这里复制已解析好的模板：XML 部件复制 lxml 元素树，二进制部件共用不可变的 bytes，
+    关系按原 rId 重建，新文档与模板之间没有共享的可变状态
+    """
+    pristine = _pristine_document()
+    src_package = pristine.part.package
+    package = type(src_package)()
+
+    clones = {}
+    with _lock:
+        for part in src_package.iter_parts():
+            if isinstance(part, XmlPart):
+                clone = type(part)(part.partname, part.content_type, copy.deepcopy(part.element), package)
+            else:
+                clone = type(part).load(part.partname, part.content_type, part.blob, package)
+            clones[part] = clone
+
+    def copy_rels(src_rels, dst_rels):
+        for rel in src_rels.values():
+            target = rel.target_ref if rel.is_external else clones[rel.target_part]
+            dst_rels.add_relationship(rel.reltype, target, rel.rId, rel.is_external)
+
+    copy_rels(src_package.rels, package.rels)
+    for part, clone in clones.items():
+        copy_rels(part.rels, clone.rels)
+    package.after_unmarshal()
+    return package.main_document_part.document
@@ -0,0 +1,78 @@
+import struct
+import tempfile
+import zipfile
+import zlib
+
+import pytest
+
+from input_scanner import scan_inputs
+
+def _zip_without_utf8_flag(entries, encoding):
+    """
+    按字节构造未压缩的 zip：文件名按 encoding 编码，通用标志位为 0（不设 UTF-8 标志），
+    与 Info-ZIP（UTF-8）和 Windows 自带压缩（GBK）生成的文件相同
+    """
+    local, central = b'', b''
+    for name, data in entries:
+        raw_name = name.encode(encoding)
+        crc = zlib.crc32(data)
+        offset = len(local)
+        local += struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, 0, 0, 0, 0x21,
+                             crc, len(data), len(data), len(raw_name), 0) + raw_name + data
+        central += struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20, 0, 0, 0, 0x21,
+                               crc, len(data), len(data), len(raw_name), 0, 0, 0, 0, 0, offset) + raw_name
+    end = struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(entries), len(entries),
+                      len(central), len(local), 0)
+    return local + central + end
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'gbk'])
+def test_member_names_without_utf8_flag(tmp_path, encoding):
+    names = ['8521001张三.docx', '子目录/8521002李四.docx']
+    (tmp_path / 'bundle.zip').write_bytes(
+        _zip_without_utf8_flag([(name, b'not a real docx') for name in names], encoding))
+    with zipfile.ZipFile(tmp_path / 'bundle.zip') as zf:
+        assert not any(info.flag_bits & 0x800 for info in zf.infolist())
+
+    paths = sorted(item.virtual_path for item in scan_inputs(str(tmp_path)))
+
+    assert paths == ['bundle.zip/8521001张三.docx', 'bundle.zip/子目录/8521002李四.docx']
+
+def test_member_names_with_utf8_flag(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'bundle.zip', 'w') as zf:
+        zf.writestr('8521001张三.docx', b'not a real docx')
+
+    assert [item.virtual_path for item in scan_inputs(str(tmp_path))] == ['bundle.zip/8521001张三.docx']
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_large_member_spools_to_disk(tmp_path, monkeypatch, compression):
+    disk_files = []
+    temporary_file = tempfile.TemporaryFile
+
+    def recording_temporary_file(*args, **kwargs):
+        disk_files.append(temporary_file(*args, **kwargs))
+        return disk_files[-1]
+    monkeypatch.setattr(tempfile, 'TemporaryFile', recording_temporary_file)
+
+    payload = bytes(range(256)) * 1024
+    with zipfile.ZipFile(tmp_path / 'bundle.zip', 'w', compression) as zf:
+        zf.writestr('班级/8521001张三.docx', payload)
+        zf.writestr('8521002李四.docx', b'small')
+    items = {item.name: item for item in scan_inputs(str(tmp_path))}
+    small, large = items['8521002李四.docx'], items['8521001张三.docx']
+
+    with small.open(spool_max_size=1024) as source:
+        assert source.read() == b'small'
+    assert disk_files == []
+    with large.open(spool_max_size=1024) as source:
+        assert len(disk_files) == 1
+        assert source.read() == payload
+    assert large.folder_tag == 'bundle.zip_班级'
+
+@pytest.mark.parametrize('name', ['../../escaped/8521001张三.docx', '/abs/8521001张三.docx',
+                                  'C:/abs/8521001张三.docx', '班级\\..\\..\\8521001张三.docx'])
+def test_unsafe_member_names_are_skipped(tmp_path, name):
+    with zipfile.ZipFile(tmp_path / 'bundle.zip', 'w') as zf:
+        zf.writestr(name, b'not a real docx')
+        zf.writestr('班级/./8521002李四.docx', b'not a real docx')
+
+    assert [item.virtual_path for item in scan_inputs(str(tmp_path))] == ['bundle.zip/班级/8521002李四.docx']
@@ -0,0 +1,30 @@
+import pytest
+
+from slow_file_profiler import SlowFileProfiler
+
+def _profiler(tmp_path, seconds, **kwargs):
+    profiler = SlowFileProfiler(str(tmp_path), **kwargs)
+    profiler.records = [(f"{index}.docx", 1024, value, None) for index, value in enumerate(seconds)]
+    return profiler
+
+SECONDS = [0.1] * 18 + [1.2, 1.5]
+
+def test_cutoff_uses_percentile_with_floor(tmp_path):
+    assert _profiler(tmp_path, SECONDS)._cutoff() == 1.2
+    assert _profiler(tmp_path, [0.1, 0.2, 0.3])._cutoff() == 1.0
+
+@pytest.mark.parametrize('threshold', [5.0, 0.2])
+def test_explicit_threshold_replaces_percentile(tmp_path, threshold):
+    assert _profiler(tmp_path, SECONDS, threshold_seconds=threshold)._cutoff() == threshold
+
+def test_cutoff_without_records_keeps_nothing(tmp_path):
+    assert _profiler(tmp_path, [])._cutoff() == float('inf')
+
+def test_finish_keeps_only_files_over_threshold(tmp_path):
+    profiler = SlowFileProfiler(str(tmp_path), threshold_seconds=5.0)
+    for index in range(3):
+        profiler.run(f"{index}.docx", 1024, lambda: None)
+    profiler.records[0] = profiler.records[0][:2] + (1.5,) + profiler.records[0][3:]
+
+    assert profiler.finish() == []
+    assert not (tmp_path / "性能分析").exists()